@@ -1,16 +1,25 @@
 import os
 import asyncio
+from functools import lru_cache
 from typing import List, Dict, Optional
 import uuid
 from langchain.agents import AgentExecutor, create_openai_tools_agent
 from langchain.tools import Tool
 from langchain.prompts import ChatPromptTemplate
 from langchain_openai import AzureChatOpenAI
-from document_processor import query_documents
+from document_processor import query_documents, embeddings
+from semantic_cache import response_cache
 from langchain.schema import SystemMessage, HumanMessage
-from web_search import search_duckduckgo, fetch_webpage_content
+from web_search import search_duckduckgo, fetch_webpage_content, fetch_many
 from memory import SQLAlchemyConversationMemory
 from database import add_message
+from langchain.globals import set_llm_cache
+from langchain_community.cache import SQLiteCache
+
+# temperature=0 makes identical prompts deterministic, so an exact-match
+# cache at the model layer is safe; every agent shares it and repeated
+# pipeline steps skip the LLM call entirely
+set_llm_cache(SQLiteCache(database_path="llm_cache.db"))
 
 # Initialize Azure OpenAI LLM
 llm = AzureChatOpenAI(
@@ -33,21 +42,38 @@ class AgentTools:
         self.doc_ids = doc_ids
         
     def get_search_tool(self):
+        # Pass the async function as `coroutine` so the agent awaits it on
+        # the running loop; the sync func only serves non-async callers
         return Tool.from_function(
             func=lambda query: asyncio.run(search_documents(query, self.doc_ids)),
+            coroutine=lambda query: search_documents(query, self.doc_ids),
             name="search_documents",
             description="Search for information in the documents. Input should be a search query."
         )
-    
+
     # Add this new tool in the AgentTools class
     def get_web_search_tool(self):
         return Tool.from_function(
             func=lambda query: asyncio.run(search_duckduckgo(query)),
+            coroutine=lambda query: search_duckduckgo(query),
             name="search_web",
             description="Search the internet for information. Input should be a search query."
         )
 
+    def get_fetch_tool(self):
+        # fetch_many fans the fetches out concurrently on the shared
+        # session, so reading several pages costs roughly the slowest one
+        return Tool.from_function(
+            func=lambda urls: asyncio.run(fetch_many(urls.split())),
+            coroutine=lambda urls: fetch_many(urls.split()),
+            name="fetch_webpages",
+            description="Fetch the text content of webpages. Input should be one or more URLs separated by spaces."
+        )
+
 # Add a new function to create a web search agent
+# Agent construction (prompt assembly, tool binding, executor setup) is pure
+# per-request overhead, so executors are cached and reused across requests
+@lru_cache(maxsize=32)
 def create_web_search_agent(conversation_id: Optional[str] = None):
     tools = AgentTools([])  # No doc_ids needed for web search
     memory = SQLAlchemyConversationMemory(conversation_id=conversation_id) if conversation_id else None
@@ -55,18 +81,21 @@ def create_web_search_agent(conversation_id: Optional[str] = None):
     prompt = ChatPromptTemplate.from_messages([
         ("system", """You are a web research agent specialized in finding information from the internet.
         Use the search_web tool to find relevant information based on the user's query.
+        When the search snippets are not enough, use the fetch_webpages tool to read the most promising results in full.
         Be thorough and precise in your research, focusing on finding factual and up-to-date information.
         Always cite your sources when providing information from the web.
         """),
         ("human", "{input}"),
         ("ai", "{agent_scratchpad}")
     ])
-    
-    agent = create_openai_tools_agent(llm, [tools.get_web_search_tool()], prompt)
-    return AgentExecutor(agent=agent, tools=[tools.get_web_search_tool()], memory=memory, verbose=True)
+
+    web_tools = [tools.get_web_search_tool(), tools.get_fetch_tool()]
+    agent = create_openai_tools_agent(llm, web_tools, prompt)
+    return AgentExecutor(agent=agent, tools=web_tools, memory=memory, verbose=True, return_intermediate_steps=True)
 
 
-def create_research_agent(doc_ids: List[str], conversation_id: Optional[str] = None):
+@lru_cache(maxsize=32)
+def create_research_agent(doc_ids: tuple, conversation_id: Optional[str] = None):
     tools = AgentTools(doc_ids)
     memory = SQLAlchemyConversationMemory(conversation_id=conversation_id) if conversation_id else None
     
@@ -80,8 +109,9 @@ def create_research_agent(doc_ids: List[str], conversation_id: Optional[str] = N
     ])
     
     agent = create_openai_tools_agent(llm, [tools.get_search_tool()], prompt)
-    return AgentExecutor(agent=agent, tools=[tools.get_search_tool()], memory=memory, verbose=True)
+    return AgentExecutor(agent=agent, tools=[tools.get_search_tool()], memory=memory, verbose=True, return_intermediate_steps=True)
 
+@lru_cache(maxsize=32)
 def create_writing_agent(conversation_id: Optional[str] = None):
     memory = SQLAlchemyConversationMemory(conversation_id=conversation_id) if conversation_id else None
     
@@ -97,6 +127,7 @@ def create_writing_agent(conversation_id: Optional[str] = None):
     agent = create_openai_tools_agent(llm, [], prompt)
     return AgentExecutor(agent=agent, tools=[], memory=memory, verbose=True)
 
+@lru_cache(maxsize=32)
 def create_validation_agent(conversation_id: Optional[str] = None):
     memory = SQLAlchemyConversationMemory(conversation_id=conversation_id) if conversation_id else None
     
@@ -112,14 +143,46 @@ def create_validation_agent(conversation_id: Optional[str] = None):
     agent = create_openai_tools_agent(llm, [], prompt)
     return AgentExecutor(agent=agent, tools=[], memory=memory, verbose=True)
 
+# Research below this size, or drawn from a single source, is simple enough
+# that a separate validation pass adds an LLM call without catching much
+VALIDATION_MIN_CHARS = 1500
+
+def _needs_validation(combined_research: str, research_results: Dict) -> bool:
+    """Decide whether the validation agent should run for this request."""
+    return len(research_results) > 1 or len(combined_research) >= VALIDATION_MIN_CHARS
+
 # Execute agents in parallel
 # Update the execute_agents_parallel function to include web search and conversation context
 async def execute_agents_parallel(query: str, doc_ids: Optional[List[str]] = None, include_web_search: bool = False, conversation_id: Optional[str] = None):
+    # Check the semantic cache before running any agents: a near-duplicate
+    # of an earlier query (same documents, same web-search setting) returns
+    # the stored answer without any LLM calls
+    context_key = f"{sorted(doc_ids) if doc_ids else []}|{include_web_search}"
+    query_vector = await asyncio.to_thread(embeddings.embed_query, query)
+    cached_response = response_cache.lookup(query_vector, context_key)
+    if cached_response is not None:
+        if conversation_id:
+            await add_message(
+                conversation_id=conversation_id,
+                role="user",
+                content=query
+            )
+            await add_message(
+                conversation_id=conversation_id,
+                role="assistant",
+                content=cached_response["answer"],
+                metadata={
+                    "validation": cached_response.get("validation"),
+                    "sources": cached_response.get("sources", [])
+                }
+            )
+        return cached_response
+
     tasks = []
-    
+
     # If document IDs are provided, run document research
     if doc_ids and len(doc_ids) > 0:
-        research_agent = create_research_agent(doc_ids, conversation_id)
+        research_agent = create_research_agent(tuple(sorted(doc_ids)), conversation_id)
         research_task = asyncio.create_task(
             research_agent.ainvoke({"input": f"Find information related to: {query}"})
         )
@@ -133,18 +196,19 @@ async def execute_agents_parallel(query: str, doc_ids: Optional[List[str]] = Non
         )
         tasks.append(("web_research", web_task))
     
-    # Execute research tasks
+    # Execute research tasks, keeping the full result dicts so the tools'
+    # structured outputs stay available in intermediate_steps
     research_results = {}
     for task_name, task in tasks:
         result = await task
-        research_results[task_name] = result.get("output", "No information found.")
-    
+        research_results[task_name] = result
+
     # Combine research results
     combined_research = ""
     if "document_research" in research_results:
-        combined_research += f"DOCUMENT SOURCES:\n{research_results['document_research']}\n\n"
+        combined_research += f"DOCUMENT SOURCES:\n{research_results['document_research'].get('output', 'No information found.')}\n\n"
     if "web_research" in research_results:
-        combined_research += f"WEB SOURCES:\n{research_results['web_research']}\n\n"
+        combined_research += f"WEB SOURCES:\n{research_results['web_research'].get('output', 'No information found.')}\n\n"
     
     if not combined_research:
         response = {"answer": "No sources available for research. Please select at least one document or enable web search.", "sources": []}
@@ -167,76 +231,69 @@ async def execute_agents_parallel(query: str, doc_ids: Optional[List[str]] = Non
         
         return response
     
-    # Execute writing and validation agents
+    # Execute the writing agent, with validation only when the research is
+    # substantial enough to warrant the second LLM pass
     writing_agent = create_writing_agent(conversation_id)
-    validation_agent = create_validation_agent(conversation_id)
-    
     writing_task = asyncio.create_task(
         writing_agent.ainvoke({
             "input": f"Create a comprehensive answer to the query: '{query}' based on this information: {combined_research}"
         })
     )
-    
-    validation_task = asyncio.create_task(
-        validation_agent.ainvoke({
-            "input": f"Validate this information and check for any inconsistencies or missing details: {combined_research}"
-        })
-    )
-    
-    # Wait for both tasks to complete
-    writing_result, validation_result = await asyncio.gather(writing_task, validation_task)
-    
-    # Extract outputs
+
+    if _needs_validation(combined_research, research_results):
+        validation_agent = create_validation_agent(conversation_id)
+        validation_task = asyncio.create_task(
+            validation_agent.ainvoke({
+                "input": f"Validate this information and check for any inconsistencies or missing details: {combined_research}"
+            })
+        )
+        writing_result, validation_result = await asyncio.gather(writing_task, validation_task)
+        validation = validation_result.get("output", "No validation performed.")
+    else:
+        writing_result = await writing_task
+        validation = ""
+
+    # Extract output
     answer = writing_result.get("output", "Could not generate an answer.")
-    validation = validation_result.get("output", "No validation performed.")
     
-    # Extract sources
+    # Extract sources directly from the tools' structured outputs in
+    # intermediate_steps instead of re-parsing the agents' free text
     sources = []
-    
-    # Extract document sources
+
+    # Document sources: search_documents returns {"results": [...]}
     if "document_research" in research_results:
-        doc_output = research_results["document_research"]
-        if "results" in doc_output:
-            try:
-                import json
-                results_str = doc_output.split("results")[1].split("]")[0] + "]"
-                results_str = "{\"results\"" + results_str
-                doc_sources = json.loads(results_str).get("results", [])
-                for source in doc_sources:
+        for _action, observation in research_results["document_research"].get("intermediate_steps", []):
+            if isinstance(observation, dict):
+                for source in observation.get("results", []):
+                    source = dict(source)
                     source["type"] = "document"
                     sources.append(source)
-            except:
-                pass
-    
-    # Extract web sources
+
+    # Web sources: search_duckduckgo returns a list of result dicts
+    # (fetch_webpages returns a list of page texts, which carry no source
+    # metadata and are skipped)
     if "web_research" in research_results:
-        web_output = research_results["web_research"]
-        if "search results" in web_output.lower():
-            try:
-                # Try to parse web search results
-                import re
-                web_sources = []
-                results_pattern = r"Title: (.*?)\nSnippet: (.*?)\nLink: (.*?)(?:\n|$)"
-                matches = re.findall(results_pattern, web_output, re.DOTALL)
-                
-                for match in matches:
-                    web_sources.append({
-                        "title": match[0],
-                        "content": match[1],
-                        "link": match[2],
+        for _action, observation in research_results["web_research"].get("intermediate_steps", []):
+            if isinstance(observation, list):
+                for item in observation:
+                    if not isinstance(item, dict):
+                        continue
+                    sources.append({
+                        "title": item.get("title", ""),
+                        "content": item.get("snippet", ""),
+                        "link": item.get("link", ""),
                         "type": "web"
                     })
-                
-                sources.extend(web_sources)
-            except:
-                pass
     
     result = {
         "answer": answer,
         "validation": validation,
         "sources": sources
     }
-    
+
+    # Cache the response for future paraphrases of this query
+    response_cache.store(query_vector, context_key, result)
+
     # Save to conversation history if conversation_id is provided
     if conversation_id:
         # Save the user message
@@ -0,0 +1,71 @@
+import hashlib
+import os
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+from diskcache import Cache
+
+# On-disk cache lives next to the FAISS indices so it survives restarts
+EMBED_CACHE_PATH = os.path.join("indices", "embed_cache")
+
+# Keep the in-process cache bounded
+MEMORY_CACHE_SIZE = 10_000
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that caches vectors keyed by SHA-256 of the text.
+
+    Hits are served from an in-process dict first, then from a persistent
+    diskcache store, so repeated queries and re-uploaded chunks skip the
+    embedding API call entirely.
+    """
+
+    def __init__(self, inner: Embeddings, namespace: str = "ada-002"):
+        self.inner = inner
+        self.namespace = namespace
+        self._memory = {}
+        self._disk = Cache(EMBED_CACHE_PATH)
+
+    def _key(self, text: str) -> bytes:
+        return hashlib.sha256((self.namespace + "\0" + text).encode()).digest()
+
+    def _get(self, key: bytes):
+        vector = self._memory.get(key)
+        if vector is None:
+            vector = self._disk.get(key)
+            if vector is not None:
+                self._remember(key, vector)
+        return vector
+
+    def _put(self, key: bytes, vector: List[float]):
+        self._remember(key, vector)
+        self._disk.set(key, vector)
+
+    def _remember(self, key: bytes, vector: List[float]):
+        # Evict the oldest entry once the in-process cache is full
+        if len(self._memory) >= MEMORY_CACHE_SIZE:
+            self._memory.pop(next(iter(self._memory)))
+        self._memory[key] = vector
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self._key(text)
+        vector = self._get(key)
+        if vector is None:
+            vector = self.inner.embed_query(text)
+            self._put(key, vector)
+        return vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key(text) for text in texts]
+        vectors = [self._get(key) for key in keys]
+
+        # Embed only the misses in a single batched call, then splice the
+        # results back in their original positions
+        miss_indices = [i for i, vector in enumerate(vectors) if vector is None]
+        if miss_indices:
+            new_vectors = self.inner.embed_documents([texts[i] for i in miss_indices])
+            for i, vector in zip(miss_indices, new_vectors):
+                vectors[i] = vector
+                self._put(keys[i], vector)
+
+        return vectors
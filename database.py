@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Text, ForeignKey, TIMESTAMP, create_engine, MetaData
+from sqlalchemy import Column, String, Text, ForeignKey, TIMESTAMP, create_engine, MetaData, event, Index, BigInteger, LargeBinary
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
@@ -11,10 +11,20 @@ import uuid
 # SQLite database URL
 DATABASE_URL = "sqlite+aiosqlite:///document_agents.db"
 
-# Create async engine
-engine = create_async_engine(DATABASE_URL, echo=True)
+# Create async engine (echo off: statement logging is pure overhead per request)
+engine = create_async_engine(DATABASE_URL, echo=False, connect_args={"timeout": 30})
 async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
+@event.listens_for(engine.sync_engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers run during writes; NORMAL halves fsyncs per commit
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA mmap_size=268435456")
+    cursor.close()
+
 # Base class for models
 Base = declarative_base()
 
@@ -35,8 +45,11 @@ class Chunk(Base):
     __tablename__ = "chunks"
     
     id = Column(String, primary_key=True)
-    doc_id = Column(String, ForeignKey("documents.id"), nullable=False)
+    doc_id = Column(String, ForeignKey("documents.id"), nullable=False, index=True)
     content = Column(Text, nullable=False)
+    content_hash = Column(String, index=True)  # SHA-256 of content, for dedup lookups
+    faiss_id = Column(BigInteger, index=True)  # id of this chunk in the global FAISS index
+    embedding = Column(LargeBinary)  # fp16 embedding vector bytes
     chunk_metadata = Column(Text)  # Renamed from 'metadata' to avoid SQLAlchemy reserved name
     
     # Relationship to document
@@ -55,6 +68,9 @@ class Conversation(Base):
 
 class Message(Base):
     __tablename__ = "messages"
+    # Composite index serves the WHERE conversation_id ... ORDER BY created_at
+    # lookup in get_conversation_messages without a sort
+    __table_args__ = (Index("ix_msg_conv_created", "conversation_id", "created_at"),)
     
     id = Column(String, primary_key=True)
     conversation_id = Column(String, ForeignKey("conversations.id"), nullable=False)
@@ -66,9 +82,30 @@ class Message(Base):
     # Relationship to conversation
     conversation = relationship("Conversation", back_populates="messages")
 
+def _migrate_schema(connection):
+    """Bring a pre-existing database up to the current schema.
+
+    create_all only creates missing tables; columns and indexes added after
+    a table already exists have to be bolted on here.
+    """
+    chunk_columns = {row[1] for row in connection.exec_driver_sql("PRAGMA table_info(chunks)")}
+    for name, ddl in (
+        ("content_hash", "content_hash VARCHAR"),
+        ("faiss_id", "faiss_id BIGINT"),
+        ("embedding", "embedding BLOB"),
+    ):
+        if name not in chunk_columns:
+            connection.exec_driver_sql(f"ALTER TABLE chunks ADD COLUMN {ddl}")
+
+    connection.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_chunks_doc_id ON chunks (doc_id)")
+    connection.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_chunks_content_hash ON chunks (content_hash)")
+    connection.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_chunks_faiss_id ON chunks (faiss_id)")
+    connection.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_msg_conv_created ON messages (conversation_id, created_at)")
+
 async def init_db():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_migrate_schema)
 
 async def add_document(doc_id: str, title: str, path: str):
     async with async_session() as session:
@@ -96,6 +133,26 @@ async def add_chunk(chunk_id: str, doc_id: str, content: str, metadata: Optional
         session.add(new_chunk)
         await session.commit()
 
+async def add_chunks(chunks: List[Dict]):
+    """Add many chunks in a single session and commit.
+
+    Each dict needs 'id', 'doc_id' and 'content', with optional 'metadata'.
+    """
+    async with async_session() as session:
+        session.add_all([
+            Chunk(
+                id=chunk["id"],
+                doc_id=chunk["doc_id"],
+                content=chunk["content"],
+                content_hash=chunk.get("content_hash"),
+                faiss_id=chunk.get("faiss_id"),
+                embedding=chunk.get("embedding"),
+                chunk_metadata=json.dumps(chunk["metadata"]) if chunk.get("metadata") else None
+            )
+            for chunk in chunks
+        ])
+        await session.commit()
+
 async def get_document(doc_id: str):
     async with async_session() as session:
         from sqlalchemy import select
@@ -155,6 +212,42 @@ async def get_document_chunks(doc_id: str):
             for chunk in chunks
         ]
 
+async def get_chunk_faiss_ids(doc_ids: List[str]) -> Dict[str, List[int]]:
+    """Map each given document to the global-index FAISS ids of its chunks.
+
+    Documents with no ids — ingested before the global index existed — are
+    absent from the result, so callers can route them to their per-document
+    indices.
+    """
+    async with async_session() as session:
+        from sqlalchemy import select
+        query = select(Chunk.doc_id, Chunk.faiss_id).where(Chunk.doc_id.in_(doc_ids), Chunk.faiss_id.isnot(None))
+        result = await session.execute(query)
+
+        ids_by_doc: Dict[str, List[int]] = {}
+        for doc_id, faiss_id in result:
+            ids_by_doc.setdefault(doc_id, []).append(faiss_id)
+        return ids_by_doc
+
+async def get_chunks_by_faiss_ids(faiss_ids: List[int]) -> List[Dict]:
+    """Get chunk rows for the given global-index FAISS ids."""
+    async with async_session() as session:
+        from sqlalchemy import select
+        query = select(Chunk).where(Chunk.faiss_id.in_(faiss_ids))
+        result = await session.execute(query)
+        chunks = result.scalars().all()
+
+        return [
+            {
+                "id": chunk.id,
+                "doc_id": chunk.doc_id,
+                "faiss_id": chunk.faiss_id,
+                "content": chunk.content,
+                "metadata": json.loads(chunk.chunk_metadata) if chunk.chunk_metadata else {}
+            }
+            for chunk in chunks
+        ]
+
 async def create_conversation(title: str) -> str:
     """Create a new conversation and return its ID."""
     conversation_id = str(uuid.uuid4())
@@ -166,22 +259,47 @@ async def create_conversation(title: str) -> str:
 
 async def add_message(conversation_id: str, role: str, content: str, metadata: Optional[Dict] = None) -> str:
     """Add a message to a conversation and return its ID."""
-    message_id = str(uuid.uuid4())
     metadata_str = json.dumps(metadata) if metadata else None
-    
+
     async with async_session() as session:
-        new_message = Message(
-            id=message_id,
+        from sqlalchemy import insert
+        # RETURNING hands the id back from the INSERT itself, with no
+        # separate SELECT or ORM refresh round trip
+        stmt = insert(Message).values(
+            id=str(uuid.uuid4()),
             conversation_id=conversation_id,
             role=role,
             content=content,
             msg_metadata=metadata_str
-        )
-        session.add(new_message)
+        ).returning(Message.id)
+        message_id = (await session.execute(stmt)).scalar_one()
         await session.commit()
-    
+
     return message_id
 
+async def add_messages_bulk(conversation_id: str, messages: List[Dict]) -> List[str]:
+    """Add many messages to a conversation in one INSERT and return their IDs.
+
+    Each dict needs 'role' and 'content', with optional 'metadata'.
+    """
+    rows = [
+        {
+            "id": str(uuid.uuid4()),
+            "conversation_id": conversation_id,
+            "role": message["role"],
+            "content": message["content"],
+            "msg_metadata": json.dumps(message["metadata"]) if message.get("metadata") else None
+        }
+        for message in messages
+    ]
+
+    async with async_session() as session:
+        from sqlalchemy import insert
+        await session.execute(insert(Message), rows)
+        await session.commit()
+
+    return [row["id"] for row in rows]
+
 async def get_conversation_messages(conversation_id: str) -> List[Dict]:
     """Get all messages for a specific conversation."""
     async with async_session() as session:
@@ -201,6 +319,26 @@ async def get_conversation_messages(conversation_id: str) -> List[Dict]:
             for message in messages
         ]
 
+async def get_recent_messages(conversation_id: str, limit: int = 40) -> List[Dict]:
+    """Get the last `limit` messages of a conversation, oldest first.
+
+    Selects only role and content — all the chat memory needs — so the
+    query stays O(limit) no matter how long the conversation grows.
+    """
+    async with async_session() as session:
+        from sqlalchemy import select
+        query = (
+            select(Message.role, Message.content)
+            .where(Message.conversation_id == conversation_id)
+            .order_by(Message.created_at.desc())
+            .limit(limit)
+        )
+        result = await session.execute(query)
+        rows = result.all()
+
+        # Rows come back newest-first; reverse into chronological order
+        return [{"role": role, "content": content} for role, content in reversed(rows)]
+
 async def get_conversations() -> List[Dict]:
     """Get all conversations."""
     async with async_session() as session:
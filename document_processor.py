@@ -1,65 +1,235 @@
 import uuid
 import os
+import hashlib
 from typing import List, Dict, Optional
 import asyncio
+from concurrent.futures import ProcessPoolExecutor
 from langchain_community.document_loaders import PyPDFLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_openai.embeddings import AzureOpenAIEmbeddings
 from langchain_community.vectorstores import FAISS
-from database import update_document_status, add_chunk, get_document, get_document_chunks
+from database import update_document_status, add_chunks, get_document, get_document_chunks, get_chunk_faiss_ids, get_chunks_by_faiss_ids
+from cached_embeddings import CachedEmbeddings
 import numpy as np
 import faiss
-import pickle
+import json
+from langchain.schema import Document
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
-# Initialize embeddings
-embeddings = AzureOpenAIEmbeddings(
+# Initialize embeddings, wrapped in a content-hash cache so repeated
+# queries and duplicate chunks don't hit the embedding API again
+embeddings = CachedEmbeddings(AzureOpenAIEmbeddings(
         openai_api_version=os.getenv("AZURE_OPENAI_API_VERSION", "2023-05-15"),
         deployment="text-embedding-ada-002",  # Make sure this deployment exists in your Azure OpenAI resource
         azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
         api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-    )
+    ))
 
 # Path to store FAISS indices
 INDEX_PATH = "indices"
 os.makedirs(INDEX_PATH, exist_ok=True)
 
+# One global FAISS index over every chunk, keyed by a 63-bit id derived from
+# the chunk uuid, so multi-document queries are a single k-NN call with a
+# doc_id filter instead of one load + search per document
+GLOBAL_INDEX_FILE = os.path.join(INDEX_PATH, "global.faiss")
+_GLOBAL_INDEX: Optional[faiss.Index] = None
+_GLOBAL_INDEX_LOCK = asyncio.Lock()
+
+def _chunk_faiss_id(chunk_id: str) -> int:
+    return int.from_bytes(hashlib.sha256(chunk_id.encode()).digest()[:8], "big") >> 1
+
+def _load_global_index() -> Optional[faiss.Index]:
+    global _GLOBAL_INDEX
+    if _GLOBAL_INDEX is None and os.path.exists(GLOBAL_INDEX_FILE):
+        _GLOBAL_INDEX = faiss.read_index(GLOBAL_INDEX_FILE)
+    return _GLOBAL_INDEX
+
+def _add_to_global_index(vector_array: np.ndarray, faiss_ids: List[int]):
+    """Append vectors to the global index and persist it."""
+    global _GLOBAL_INDEX
+    index = _load_global_index()
+    if index is None:
+        index = faiss.IndexIDMap2(faiss.IndexFlatL2(vector_array.shape[1]))
+        _GLOBAL_INDEX = index
+    index.add_with_ids(vector_array, np.asarray(faiss_ids, dtype=np.int64))
+    faiss.write_index(index, GLOBAL_INDEX_FILE)
+
+def _index_file(doc_id: str) -> str:
+    return os.path.join(INDEX_PATH, f"{doc_id}.faiss")
+
+def _docstore_file(doc_id: str) -> str:
+    return os.path.join(INDEX_PATH, f"{doc_id}.docstore.json")
+
+def _save_vectorstore(vectorstore: FAISS, doc_id: str):
+    """Persist a vectorstore as a native FAISS file plus a JSON docstore."""
+    faiss.write_index(vectorstore.index, _index_file(doc_id))
+
+    docstore = {
+        str(position): {
+            "id": docstore_id,
+            "page_content": vectorstore.docstore.search(docstore_id).page_content,
+            "metadata": vectorstore.docstore.search(docstore_id).metadata
+        }
+        for position, docstore_id in vectorstore.index_to_docstore_id.items()
+    }
+    with open(_docstore_file(doc_id), "w") as f:
+        json.dump(docstore, f)
+
+def _read_vectorstore(doc_id: str) -> FAISS:
+    """Load a native FAISS index via mmap and rebuild the wrapper."""
+    try:
+        index = faiss.read_index(_index_file(doc_id), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError:
+        # Not every index type supports mmap; fall back to a full read
+        index = faiss.read_index(_index_file(doc_id))
+
+    with open(_docstore_file(doc_id)) as f:
+        entries = json.load(f)
+
+    documents = {
+        entry["id"]: Document(page_content=entry["page_content"], metadata=entry["metadata"])
+        for entry in entries.values()
+    }
+    index_to_id = {int(position): entry["id"] for position, entry in entries.items()}
+
+    return FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=InMemoryDocstore(documents),
+        index_to_docstore_id=index_to_id
+    )
+
+# In-process cache of loaded vectorstores keyed by doc_id, storing the
+# index file's mtime so a re-processed document invalidates its entry
+_VS_CACHE: Dict[str, tuple] = {}
+_VS_LOCKS: Dict[str, asyncio.Lock] = {}
+
+async def _load_vectorstore(doc_id: str, index_path: str) -> FAISS:
+    """Load a document's FAISS index, reusing a cached copy when fresh."""
+    mtime = os.path.getmtime(index_path)
+
+    cached = _VS_CACHE.get(doc_id)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    # One lock per doc_id so concurrent queries don't load the same index twice
+    lock = _VS_LOCKS.setdefault(doc_id, asyncio.Lock())
+    async with lock:
+        cached = _VS_CACHE.get(doc_id)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+        if index_path.endswith(".faiss"):
+            vectorstore = await asyncio.to_thread(_read_vectorstore, doc_id)
+        else:
+            # Legacy pickle format from before the native index switch
+            vectorstore = await asyncio.to_thread(
+                FAISS.load_local, index_path, embeddings, allow_dangerous_deserialization=True
+            )
+        _VS_CACHE[doc_id] = (mtime, vectorstore)
+        return vectorstore
+
+# Process pool for the CPU-bound PDF parse and text split, created lazily
+# so worker processes only spawn once ingestion actually happens
+_PDF_POOL: Optional[ProcessPoolExecutor] = None
+
+def _get_pdf_pool() -> ProcessPoolExecutor:
+    global _PDF_POOL
+    if _PDF_POOL is None:
+        _PDF_POOL = ProcessPoolExecutor(max_workers=os.cpu_count())
+    return _PDF_POOL
+
+def _load_and_split(file_path: str) -> List[Dict]:
+    """Parse a PDF and split it into chunks. Runs in a worker process."""
+    loader = PyPDFLoader(file_path)
+    documents = loader.load()
+
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=1000,
+        chunk_overlap=200
+    )
+    chunks = text_splitter.split_documents(documents)
+
+    # Return plain dicts so the result pickles cheaply across the pool boundary
+    return [
+        {"content": chunk.page_content, "page": chunk.metadata.get("page", 0)}
+        for chunk in chunks
+    ]
+
 async def process_document(doc_id: str, file_path: str):
     try:
-        # Extract text from PDF
-        loader = PyPDFLoader(file_path)
-        documents = loader.load()
-        
-        # Split text into chunks
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200
+        # Extract text and split into chunks in a worker process so the
+        # event loop stays responsive while PDFs are parsed
+        chunks = await asyncio.get_running_loop().run_in_executor(
+            _get_pdf_pool(), _load_and_split, file_path
         )
-        chunks = text_splitter.split_documents(documents)
-        
-        # Store chunks in database
-        for chunk in chunks:
-            chunk_id = str(uuid.uuid4())
-            content = chunk.page_content
-            metadata = {
-                "page": chunk.metadata.get("page", 0),
-                "source": file_path
-            }
-            await add_chunk(chunk_id, doc_id, content, metadata)
-        
+
+        texts = [chunk["content"] for chunk in chunks]
+        content_hashes = [hashlib.sha256(text.encode()).hexdigest() for text in texts]
+        chunk_ids = [str(uuid.uuid4()) for _ in chunks]
+        faiss_ids = [_chunk_faiss_id(chunk_id) for chunk_id in chunk_ids]
+
         # Create embeddings and store in FAISS index
-        texts = [chunk.page_content for chunk in chunks]
-        metadatas = [{"chunk_id": str(uuid.uuid4()), "doc_id": doc_id, "page": chunk.metadata.get("page", 0)} for chunk in chunks]
-        
-        # Create FAISS index
-        vectorstore = FAISS.from_texts(texts, embeddings, metadatas=metadatas)
+        metadatas = [{"chunk_id": chunk_id, "doc_id": doc_id, "page": chunk["page"]} for chunk, chunk_id in zip(chunks, chunk_ids)]
+
+        # Deduplicate by content hash before embedding, so repeated
+        # boilerplate (headers, footers, TOCs) is embedded once per batch;
+        # the embedding cache already covers repeats across uploads
+        unique_texts = {}
+        for content_hash, text in zip(content_hashes, texts):
+            if content_hash not in unique_texts:
+                unique_texts[content_hash] = text
+
+        # Embed the unique texts in one batched call off the event loop, then
+        # fan the vectors back out so FAISS doesn't embed again
+        unique_vectors = await asyncio.to_thread(embeddings.embed_documents, list(unique_texts.values()))
+        vector_by_hash = dict(zip(unique_texts.keys(), unique_vectors))
+        vectors = [vector_by_hash[content_hash] for content_hash in content_hashes]
+
+        # Store chunks in database with a single transaction, embedding
+        # included as fp16 so the vector can be rebuilt without the API
+        await add_chunks([
+            {
+                "id": chunk_id,
+                "doc_id": doc_id,
+                "content": chunk["content"],
+                "content_hash": content_hash,
+                "faiss_id": faiss_id,
+                "embedding": np.asarray(vector, dtype=np.float16).tobytes(),
+                "metadata": {
+                    "page": chunk["page"],
+                    "source": file_path
+                }
+            }
+            for chunk, chunk_id, content_hash, faiss_id, vector
+            in zip(chunks, chunk_ids, content_hashes, faiss_ids, vectors)
+        ])
+
+        vectorstore = FAISS.from_embeddings(list(zip(texts, vectors)), embeddings, metadatas=metadatas)
+
+        # Swap the default flat FP32 index for an int8 scalar-quantized one:
+        # 4x smaller on disk and in RAM, SIMD int8 distance kernels, and
+        # negligible recall loss at k=5. Vectors are re-added in the same
+        # order, so the docstore id mapping stays valid.
+        vector_array = np.asarray(vectors, dtype=np.float32)
+        quantized_index = faiss.IndexScalarQuantizer(vector_array.shape[1], faiss.ScalarQuantizer.QT_8bit)
+        quantized_index.train(vector_array)
+        quantized_index.add(vector_array)
+        vectorstore.index = quantized_index
         
-        # Save index
-        index_path = os.path.join(INDEX_PATH, f"{doc_id}.pkl")
-        vectorstore.save_local(index_path)
+        # Save the index natively (mmap-able on load) with a JSON docstore
+        # instead of pickling the whole vectorstore
+        await asyncio.to_thread(_save_vectorstore, vectorstore, doc_id)
+
+        # Append this document's vectors to the global index so queries can
+        # search all selected documents in one call
+        async with _GLOBAL_INDEX_LOCK:
+            await asyncio.to_thread(_add_to_global_index, vector_array, faiss_ids)
         
         # Update document status
         await update_document_status(doc_id, "processed", {"chunk_count": len(chunks)})
@@ -69,38 +239,102 @@ async def process_document(doc_id: str, file_path: str):
         await update_document_status(doc_id, "error", {"error": str(e)})
         return {"status": "error", "error": str(e)}
 
-async def query_documents(query: str, doc_ids: Optional[List[str]] = None):
-    if not doc_ids:
-        return {"results": [], "error": "No documents specified"}
-    
-    combined_results = []
-    
-    for doc_id in doc_ids:
+async def _search_one(doc_id: str, query_vector: List[float]):
+    """Load one document's FAISS index and search it with the query vector."""
+    index_path = _index_file(doc_id)
+    if not os.path.exists(index_path):
+        # Documents processed before the native index switch still have
+        # pickle indices on disk
         index_path = os.path.join(INDEX_PATH, f"{doc_id}.pkl")
         if not os.path.exists(index_path):
+            return []
+
+    # Load the index (cached after first touch) and search off the event loop
+    vectorstore = await _load_vectorstore(doc_id, index_path)
+    results = await asyncio.to_thread(
+        vectorstore.similarity_search_with_score_by_vector, query_vector, 5
+    )
+
+    # Get document info
+    doc = await get_document(doc_id)
+
+    # Format results
+    return [
+        {
+            "doc_id": doc_id,
+            "title": doc.get("title", "Unknown"),
+            "content": doc_chunk.page_content,
+            "page": doc_chunk.metadata.get("page", 0),
+            "score": float(score),
+            "source": doc.get("path", "Unknown")
+        }
+        for doc_chunk, score in results
+    ]
+
+async def _search_global(query_vector: List[float], faiss_ids: List[int], doc_ids: List[str]):
+    """Run one k-NN call over the global index, restricted to the given chunks."""
+    def _search():
+        index = _load_global_index()
+        selector = faiss.IDSelectorBatch(np.asarray(faiss_ids, dtype=np.int64))
+        vector = np.asarray([query_vector], dtype=np.float32)
+        return index.search(vector, 5 * len(doc_ids), params=faiss.SearchParameters(sel=selector))
+
+    distances, ids = await asyncio.to_thread(_search)
+
+    hit_ids = [int(faiss_id) for faiss_id in ids[0] if faiss_id >= 0]
+    if not hit_ids:
+        return []
+
+    # Resolve the hits back to chunk rows and document info
+    chunk_rows = await get_chunks_by_faiss_ids(hit_ids)
+    chunks_by_id = {row["faiss_id"]: row for row in chunk_rows}
+    docs = dict(zip(doc_ids, await asyncio.gather(*[get_document(doc_id) for doc_id in doc_ids])))
+
+    results = []
+    for distance, faiss_id in zip(distances[0], ids[0]):
+        row = chunks_by_id.get(int(faiss_id))
+        if row is None:
             continue
-        
-        # Load the index
-        vectorstore = FAISS.load_local(index_path, embeddings, allow_dangerous_deserialization=True)
-        
-        # Search for similar documents
-        results = vectorstore.similarity_search_with_score(query, k=5)
-        
-        # Get document info
-        doc = await get_document(doc_id)
-        
-        # Format results
-        for doc_chunk, score in results:
-            combined_results.append({
-                "doc_id": doc_id,
-                "title": doc.get("title", "Unknown"),
-                "content": doc_chunk.page_content,
-                "page": doc_chunk.metadata.get("page", 0),
-                "score": float(score),
-                "source": doc.get("path", "Unknown")
-            })
-    
+        doc = docs.get(row["doc_id"]) or {}
+        results.append({
+            "doc_id": row["doc_id"],
+            "title": doc.get("title", "Unknown"),
+            "content": row["content"],
+            "page": row["metadata"].get("page", 0),
+            "score": float(distance),
+            "source": doc.get("path", "Unknown")
+        })
+    return results
+
+async def query_documents(query: str, doc_ids: Optional[List[str]] = None):
+    if not doc_ids:
+        return {"results": [], "error": "No documents specified"}
+
+    # Embed the query once (off the event loop — a cache miss is an HTTPS
+    # round trip) and reuse the vector for every index instead of
+    # re-embedding per doc_id inside similarity_search_with_score
+    query_vector = await asyncio.to_thread(embeddings.embed_query, query)
+
+    # Split the selection by index generation: documents with global-index
+    # ids share a single filtered search, while documents ingested before
+    # the global index existed fall back to their per-document indices,
+    # searched concurrently. Both halves run in the same gather.
+    ids_by_doc = await get_chunk_faiss_ids(doc_ids)
+    if _load_global_index() is None:
+        ids_by_doc = {}
+    global_doc_ids = [doc_id for doc_id in doc_ids if doc_id in ids_by_doc]
+    legacy_doc_ids = [doc_id for doc_id in doc_ids if doc_id not in ids_by_doc]
+
+    searches = []
+    if global_doc_ids:
+        faiss_ids = [faiss_id for doc_id in global_doc_ids for faiss_id in ids_by_doc[doc_id]]
+        searches.append(_search_global(query_vector, faiss_ids, global_doc_ids))
+    searches.extend(_search_one(doc_id, query_vector) for doc_id in legacy_doc_ids)
+
+    results_per_search = await asyncio.gather(*searches)
+    combined_results = [result for search_results in results_per_search for result in search_results]
+
     # Sort by relevance score
     combined_results.sort(key=lambda x: x["score"])
-    
-    return {"results": combined_results}
\ No newline at end of file
+
+    return {"results": combined_results}
@@ -1,29 +1,37 @@
 from fastapi import FastAPI, File, UploadFile, HTTPException, BackgroundTasks, Form
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 from typing import List, Optional
 import uvicorn
 import os
 import uuid
+import aiofiles
 from contextlib import asynccontextmanager
 from database import init_db, add_document, get_document, get_all_documents, create_conversation, add_message, get_conversation_messages, get_conversations
 from document_processor import process_document, query_documents
 from agents import execute_agents_parallel
 from schemas import CreateConversationRequest, ConversationMessageRequest
+from web_search import close_session
 
 # Create uploads directory if it doesn't exist
 os.makedirs("uploads", exist_ok=True)
 
+# Uploads larger than this are rejected with 413
+MAX_UPLOAD_BYTES = 50 * 1024 * 1024
+
 # Define lifespan context manager
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup: initialize database
     await init_db()
     yield
-    # Shutdown: perform cleanup if needed
-    pass
+    # Shutdown: close the shared web-search HTTP session
+    await close_session()
 
-app = FastAPI(lifespan=lifespan)
+# orjson serializes responses in C — matters for /query responses that
+# carry large source/snippet payloads
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 # CORS middleware
 app.add_middleware(
@@ -44,13 +52,33 @@ async def upload_file(
     file: UploadFile = File(...),
     title: str = Form(...)
 ):
+    # Reject oversized uploads before any disk I/O when the client sent a
+    # Content-Length
+    if file.size and file.size > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail="File too large")
+
     # Generate unique ID for the document
     doc_id = str(uuid.uuid4())
-    
-    # Save file locally
+
+    # Stream the upload to disk in 1MB chunks so memory stays constant and
+    # the event loop isn't blocked on synchronous writes
     file_path = f"uploads/{doc_id}.pdf"
-    with open(file_path, "wb") as f:
-        f.write(await file.read())
+    total_bytes = 0
+    too_large = False
+    async with aiofiles.open(file_path, "wb") as f:
+        while chunk := await file.read(1 << 20):
+            total_bytes += len(chunk)
+            # Enforce the cap during the copy too, in case the size header
+            # was missing or wrong
+            if total_bytes > MAX_UPLOAD_BYTES:
+                too_large = True
+                break
+            await f.write(chunk)
+
+    if too_large:
+        os.remove(file_path)
+        raise HTTPException(status_code=413, detail="File too large")
+    await file.close()
     
     # Add document to database
     await add_document(doc_id, title, file_path)
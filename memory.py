@@ -1,58 +1,73 @@
-from langchain.memory import ConversationBufferMemory
-from langchain.schema import SystemMessage, HumanMessage, AIMessage
+from langchain.schema import BaseMemory, SystemMessage, HumanMessage, AIMessage
 from typing import List, Dict, Optional, Any
+import asyncio
 import uuid
-from database import add_message, get_conversation_messages
+from database import add_messages_bulk, get_recent_messages
 from pydantic import Field
 
-class SQLAlchemyConversationMemory(ConversationBufferMemory):
+# Maps stored roles to their LangChain message constructors
+_ROLE_CTOR = {"user": HumanMessage, "assistant": AIMessage, "system": SystemMessage}
+
+class SQLAlchemyConversationMemory(BaseMemory):
     """
     A conversation memory that persists messages to SQLAlchemy database.
+
+    The database is the source of truth and there is no in-process buffer,
+    so this extends the minimal BaseMemory interface rather than dragging
+    in ConversationBufferMemory's buffer bookkeeping.
     """
     
     conversation_id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    memory_key: str = "chat_history"
+    k: int = 40  # Number of recent messages to load as context
     
-    def __init__(self, conversation_id: str = None, return_messages: bool = True, **kwargs):
-        super().__init__(return_messages=return_messages, **kwargs)
+    def __init__(self, conversation_id: str = None, k: int = 40, **kwargs):
+        super().__init__(**kwargs)
         if conversation_id:
             self.conversation_id = conversation_id
-        self.memory_key = "chat_history"
-        self.human_prefix = "Human"
-        self.ai_prefix = "AI"
+        self.k = k
     
-    async def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+    @property
+    def memory_variables(self) -> List[str]:
+        return [self.memory_key]
+    
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        """Sync bridge for non-async callers; agents use the async variant."""
+        return asyncio.run(self.aload_memory_variables(inputs))
+
+    async def aload_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
         """Load the memory variables from the database."""
         if not self.conversation_id:
             return {self.memory_key: []}
         
-        db_messages = await get_conversation_messages(self.conversation_id)
-        
-        # Convert to LangChain message format
-        messages = []
-        for msg in db_messages:
-            if msg["role"] == "user":
-                messages.append(HumanMessage(content=msg["content"]))
-            elif msg["role"] == "assistant":
-                messages.append(AIMessage(content=msg["content"]))
-            elif msg["role"] == "system":
-                messages.append(SystemMessage(content=msg["content"]))
+        # Fetch only the last k turns with a server-side LIMIT and a
+        # role/content projection, instead of replaying the whole history
+        db_messages = await get_recent_messages(self.conversation_id, limit=self.k)
         
+        # Convert to LangChain message format via dict dispatch
+        messages = [
+            _ROLE_CTOR[msg["role"]](content=msg["content"])
+            for msg in db_messages if msg["role"] in _ROLE_CTOR
+        ]
+
         return {self.memory_key: messages}
     
-    async def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
+        """Sync bridge for non-async callers; agents use the async variant."""
+        asyncio.run(self.asave_context(inputs, outputs))
+
+    async def asave_context(self, inputs: Dict[str, Any], outputs: Dict[str, str]) -> None:
         """Save the context of this conversation to the database."""
         if not self.conversation_id:
             return
         
-        # Save input (user message)
+        # Collect the user and AI turns, then write both in one batched
+        # insert instead of a round trip per message
+        messages = []
+
         if "input" in inputs:
-            await add_message(
-                conversation_id=self.conversation_id,
-                role="user",
-                content=inputs["input"]
-            )
-        
-        # Save output (AI message)
+            messages.append({"role": "user", "content": inputs["input"]})
+
         if "output" in outputs:
             metadata = None
             if "sources" in outputs:
@@ -61,13 +76,11 @@ class SQLAlchemyConversationMemory(ConversationBufferMemory):
                 if not metadata:
                     metadata = {}
                 metadata["validation"] = outputs["validation"]
-                
-            await add_message(
-                conversation_id=self.conversation_id,
-                role="assistant",
-                content=outputs["output"],
-                metadata=metadata
-            )
+
+            messages.append({"role": "assistant", "content": outputs["output"], "metadata": metadata})
+
+        if messages:
+            await add_messages_bulk(self.conversation_id, messages)
     
     def clear(self) -> None:
         """Clear memory contents."""
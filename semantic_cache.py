@@ -0,0 +1,63 @@
+from typing import Dict, List, Optional
+import numpy as np
+import faiss
+
+# Cosine similarity a cached query must reach to count as a hit
+SIMILARITY_THRESHOLD = 0.95
+
+# Flush the cache once it grows past this many entries
+MAX_ENTRIES = 256
+
+class SemanticResponseCache:
+    """
+    Cache of full pipeline responses keyed by query embedding.
+
+    Entries are stored in a small FAISS inner-product index over
+    L2-normalized query vectors, so paraphrases of earlier queries hit
+    without an exact string match. Each entry remembers the doc_ids /
+    web-search context it was produced under and only matches within the
+    same context.
+    """
+
+    def __init__(self, threshold: float = SIMILARITY_THRESHOLD, max_entries: int = MAX_ENTRIES):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._index: Optional[faiss.IndexFlatIP] = None
+        self._entries: List[Dict] = []
+
+    @staticmethod
+    def _normalize(query_vector: List[float]) -> np.ndarray:
+        array = np.asarray(query_vector, dtype=np.float32).reshape(1, -1)
+        faiss.normalize_L2(array)
+        return array
+
+    def lookup(self, query_vector: List[float], context_key: str) -> Optional[Dict]:
+        """Return the cached response for a near-duplicate query, or None."""
+        if self._index is None or self._index.ntotal == 0:
+            return None
+
+        scores, ids = self._index.search(self._normalize(query_vector), 1)
+        if ids[0][0] < 0 or scores[0][0] < self.threshold:
+            return None
+
+        entry = self._entries[int(ids[0][0])]
+        if entry["context_key"] != context_key:
+            return None
+        return entry["response"]
+
+    def store(self, query_vector: List[float], context_key: str, response: Dict):
+        """Add a pipeline response to the cache."""
+        array = self._normalize(query_vector)
+
+        if self._index is None:
+            self._index = faiss.IndexFlatIP(array.shape[1])
+        elif self._index.ntotal >= self.max_entries:
+            # Flat indices don't support cheap eviction; flush and start over
+            self._index.reset()
+            self._entries = []
+
+        self._index.add(array)
+        self._entries.append({"context_key": context_key, "response": response})
+
+# Shared instance used by the agent pipeline
+response_cache = SemanticResponseCache()
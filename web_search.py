@@ -1,87 +1,234 @@
 import aiohttp
 import asyncio
-from bs4 import BeautifulSoup
+import re
+from bs4 import BeautifulSoup, SoupStrainer
+from lxml import etree
 import urllib.parse
+from urllib.parse import unquote
+from cachetools import TTLCache
 from typing import List, Dict, Optional, Any
 
+# DDG search endpoint; the query slots in via str.format
+_DDG_URL = "https://html.duckduckgo.com/html/?q={}"
+
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/96.0.4664.110 Safari/537.36",
+    # aiohttp decompresses transparently; compressed transfer cuts page
+    # bandwidth several-fold
+    "Accept-Encoding": "gzip, deflate"
+}
+
+# Collapses runs of whitespace in extracted page text
+_WS = re.compile(r"\s+")
+
+# fetch_webpage_content returns at most this much text
+MAX_CONTENT_CHARS = 10000
+
+# Size of the chunks the response body is streamed in
+FETCH_CHUNK_SIZE = 16384
+
+# Hard ceiling on bytes read per page: script-heavy pages can yield little
+# text per byte, so the text cap alone doesn't bound the download
+MAX_FETCH_BYTES = 262144
+
+# Only materialize the result divs from the DDG page instead of the full DOM
+_RESULT_STRAINER = SoupStrainer("div", class_="result")
+
+# Shared session so keep-alive, connection pooling and the DNS cache apply
+# across calls instead of paying TCP + TLS setup per request
+_session: Optional[aiohttp.ClientSession] = None
+
+async def get_session() -> aiohttp.ClientSession:
+    """Get the shared HTTP session, creating it lazily."""
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=100, limit_per_host=10, ttl_dns_cache=300, keepalive_timeout=30),
+            timeout=aiohttp.ClientTimeout(total=15),
+            headers=DEFAULT_HEADERS
+        )
+    return _session
+
+async def close_session():
+    """Close the shared HTTP session. Called on application shutdown."""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+def _parse_ddg_results(html: bytes, charset: Optional[str], num_results: int) -> List[Dict[str, Any]]:
+    """Parse result divs out of a DDG page. Runs in a worker thread."""
+    # Hand BS4 raw bytes with the declared charset so it skips encoding
+    # detection, and parse with the C-backed lxml parser
+    soup = BeautifulSoup(html, "lxml", from_encoding=charset, parse_only=_RESULT_STRAINER)
+
+    results = []
+    seen_links = set()
+
+    # Extract search results with CSS selectors: select/select_one compile
+    # to a single traversal each instead of a fresh tree walk per find call.
+    # Scan up to 2x the requested count so duplicates don't starve the
+    # result list, and stop as soon as it's full
+    for result in soup.select("div.result", limit=num_results * 2):
+        title_element = result.select_one("a.result__a")
+        snippet_element = result.select_one("a.result__snippet")
+
+        if title_element and snippet_element:
+            title = title_element.get_text().strip()
+            snippet = snippet_element.get_text().strip()
+            link = title_element.get("href")
+
+            # Clean the URL from DuckDuckGo's redirect. The format is known
+            # (/l/?uddg=<encoded>&...), so slice the parameter out directly
+            # instead of running two full URL parses per result
+            if link and link.startswith("/l/?"):
+                encoded_link = link.partition("uddg=")[2].partition("&")[0]
+                if encoded_link:
+                    link = unquote(encoded_link)
+
+            # DDG sometimes repeats a URL (ads, region variants); keep the
+            # first occurrence only
+            if link in seen_links:
+                continue
+            seen_links.add(link)
+
+            results.append({
+                "title": title,
+                "snippet": snippet,
+                "link": link,
+                "source": "web"
+            })
+
+            if len(results) == num_results:
+                break
+
+    return results
+
+# Short-lived caches for repeated lookups, with a per-key lock so
+# concurrent callers piggyback on one request instead of duplicating it
+_SEARCH_CACHE = TTLCache(maxsize=256, ttl=300)
+_PAGE_CACHE = TTLCache(maxsize=512, ttl=600)
+_CACHE_LOCKS: Dict[Any, asyncio.Lock] = {}
+
 async def search_duckduckgo(query: str, num_results: int = 5) -> List[Dict[str, Any]]:
     """
     Search the web using DuckDuckGo (no API key required)
     """
-    encoded_query = urllib.parse.quote_plus(query)
-    url = f"https://html.duckduckgo.com/html/?q={encoded_query}"
-    
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/96.0.4664.110 Safari/537.36"
-    }
-    
+    cache_key = (query, num_results)
+    if cache_key in _SEARCH_CACHE:
+        return _SEARCH_CACHE[cache_key]
+
+    lock = _CACHE_LOCKS.setdefault(cache_key, asyncio.Lock())
+    async with lock:
+        if cache_key in _SEARCH_CACHE:
+            return _SEARCH_CACHE[cache_key]
+        results = await _search_duckduckgo(query, num_results)
+        if results:
+            _SEARCH_CACHE[cache_key] = results
+        _CACHE_LOCKS.pop(cache_key, None)
+        return results
+
+async def _search_duckduckgo(query: str, num_results: int) -> List[Dict[str, Any]]:
+    url = _DDG_URL.format(urllib.parse.quote_plus(query))
+
     results = []
-    
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url, headers=headers) as response:
-            if response.status == 200:
-                html = await response.text()
-                soup = BeautifulSoup(html, "html.parser")
-                
-                # Extract search results
-                search_results = soup.find_all("div", class_="result")
-                
-                for i, result in enumerate(search_results):
-                    if i >= num_results:
-                        break
-                    
-                    title_element = result.find("a", class_="result__a")
-                    snippet_element = result.find("a", class_="result__snippet")
-                    
-                    if title_element and snippet_element:
-                        title = title_element.get_text().strip()
-                        snippet = snippet_element.get_text().strip()
-                        link = title_element.get("href")
-                        
-                        # Clean the URL from DuckDuckGo's redirect
-                        if link and link.startswith("/l/?"):
-                            parsed_url = urllib.parse.parse_qs(urllib.parse.urlparse(link).query)
-                            if "uddg" in parsed_url:
-                                link = parsed_url["uddg"][0]
-                        
-                        results.append({
-                            "title": title,
-                            "snippet": snippet,
-                            "link": link,
-                            "source": "web"
-                        })
-            
+
+    session = await get_session()
+    async with session.get(url) as response:
+        if response.status == 200:
+            html = await response.read()
+            # Parse in a worker thread; lxml releases the GIL during the
+            # C-level parse so the event loop keeps serving other requests
+            results = await asyncio.to_thread(_parse_ddg_results, html, response.charset, num_results)
+
     return results
 
+def _drain_parser(parser, chunk: bytes, parts: List[str]) -> int:
+    """Feed one chunk to the pull parser and collect the text it completes.
+
+    Returns the number of characters added. Runs in a worker thread.
+    """
+    parser.feed(chunk)
+    added = 0
+    for _event, element in parser.read_events():
+        # Skip script and style content
+        if element.tag in ("script", "style"):
+            element.clear()
+            continue
+        for piece in (element.text, element.tail):
+            if piece and piece.strip():
+                parts.append(piece.strip())
+                added += len(piece) + 1
+        element.clear()
+    return added
+
 async def fetch_webpage_content(url: str) -> Optional[str]:
     """
-    Fetch and extract the main content from a webpage
+    Fetch and extract the main content from a webpage, with a TTL cache.
+
+    Agents frequently revisit the same URLs across queries; a hit costs a
+    dict lookup instead of a network round trip plus parse.
+    """
+    if url in _PAGE_CACHE:
+        return _PAGE_CACHE[url]
+
+    lock = _CACHE_LOCKS.setdefault(url, asyncio.Lock())
+    async with lock:
+        if url in _PAGE_CACHE:
+            return _PAGE_CACHE[url]
+        content = await _fetch_webpage_content(url)
+        if content is not None:
+            _PAGE_CACHE[url] = content
+        _CACHE_LOCKS.pop(url, None)
+        return content
+
+async def _fetch_webpage_content(url: str) -> Optional[str]:
+    """
+    Fetch and extract the main content from a webpage.
+
+    The body is streamed through an incremental HTML parser and reading
+    stops once enough text has accumulated, so time and memory are bounded
+    by the content cap rather than by the page size.
     """
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/96.0.4664.110 Safari/537.36"
-    }
-    
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers) as response:
-                if response.status == 200:
-                    html = await response.text()
-                    soup = BeautifulSoup(html, "html.parser")
-                    
-                    # Remove script and style elements
-                    for script in soup(["script", "style"]):
-                        script.decompose()
-                    
-                    # Get text content
-                    text = soup.get_text(separator=' ', strip=True)
-                    
-                    # Clean up text (remove excessive whitespace)
-                    lines = (line.strip() for line in text.splitlines())
-                    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-                    text = '\n'.join(chunk for chunk in chunks if chunk)
-                    
-                    return text[:10000]  # Limit content size
+        session = await get_session()
+        async with session.get(url) as response:
+            if response.status != 200:
+                return None
+
+            parser = etree.HTMLPullParser(events=("end",))
+            parts = []
+            total = 0
+            bytes_read = 0
+
+            async for chunk in response.content.iter_chunked(FETCH_CHUNK_SIZE):
+                bytes_read += len(chunk)
+                # Parse each chunk in a worker thread so the loop stays free
+                total += await asyncio.to_thread(_drain_parser, parser, chunk, parts)
+                if total >= MAX_CONTENT_CHARS or bytes_read >= MAX_FETCH_BYTES:
+                    break
+
+            # Collapse whitespace in one pass inside the C regex engine
+            text = _WS.sub(' ', ' '.join(parts)).strip()
+
+            return text[:MAX_CONTENT_CHARS]
     except Exception as e:
         print(f"Error fetching {url}: {e}")
-        
-    return None
\ No newline at end of file
+
+    return None
+
+async def fetch_many(urls: List[str], concurrency: int = 10) -> List[Optional[str]]:
+    """
+    Fetch the content of many webpages concurrently.
+
+    Fetches run in parallel behind a bounded semaphore on the shared
+    session, so an N-URL fan-out costs roughly the slowest fetch rather
+    than the sum of all of them.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch_one(url: str) -> Optional[str]:
+        async with semaphore:
+            return await fetch_webpage_content(url)
+
+    return await asyncio.gather(*(fetch_one(url) for url in urls))